@@ -0,0 +1,243 @@
+# src/case_index.py
+"""
+Inverted case index for ad-hoc drilldown queries.
+
+Build once from the clustered CSV, then answer conjunctive questions like
+"all cases for drug X with reaction Y in weeks A-B that were serious" without
+re-reading the CSV.
+
+Layout (single .npz file):
+  ids                 sorted unique primaryids (the case universe)
+  drug_vocab/pt_vocab sorted upper-cased names; a name's position is its code
+  drug_offsets/_post  CSR posting lists: positions into `ids`, sorted
+  pt_offsets/_post    same for PTs
+  week_vocab          sorted week periods ("YYYY-MM-DD/YYYY-MM-DD")
+  week_code           per-case week code (-1 when the event date is unknown)
+  serious_bits        np.packbits bitmap over `ids`
+
+Postings hold positions into `ids` rather than raw primaryids so the week and
+serious filters are plain array lookups. Because `ids` is sorted, positions are
+ordered exactly like the primaryids they stand for.
+
+Usage:
+  python src/case_index.py build --clustered data/faers_clustered.csv --out outputs/case_index.npz
+  python src/case_index.py query --index outputs/case_index.npz --drug XOLAIR --pt "Middle insomnia" \
+      --week_from 2015-01-01 --week_to 2015-06-30 --serious   (or --non_serious)
+"""
+
+import argparse
+import os
+import time
+import numpy as np
+
+SERIOUS_VALUES = ["Y", "YES", "1", "SERIOUS", "S"]
+
+
+def _find_col(df, names):
+    return next((c for c in df.columns if c.lower() in names), None)
+
+
+def _postings(keys, pos, n_ids):
+    """Group case positions by key. Returns (vocab, offsets, postings)."""
+    vocab, codes = np.unique(keys, return_inverse=True)
+    # one entry per (key, case); sorting the combined code sorts by key then by position
+    pairs = np.unique(codes.astype(np.int64) * n_ids + pos)
+    key_codes = pairs // n_ids
+    postings = (pairs % n_ids).astype(np.int32)
+
+    if len(vocab) and vocab[0] == "":
+        # blank names are not queryable
+        postings = postings[key_codes > 0]
+        key_codes = key_codes[key_codes > 0] - 1
+        vocab = vocab[1:]
+
+    offsets = np.searchsorted(key_codes, np.arange(len(vocab) + 1)).astype(np.int64)
+    return vocab.astype(str), offsets, postings
+
+
+def build_index(clustered_csv, out_path):
+    # pandas only for building; loading and querying need numpy alone
+    import pandas as pd
+
+    df = pd.read_csv(clustered_csv, dtype=str)
+
+    drug_col = _find_col(df, ("drugname", "drug_name", "drug"))
+    react_col = _find_col(df, ("pt", "reaction", "preferred_term"))
+    case_col = _find_col(df, ("primaryid", "caseid", "report_id", "id"))
+    serious_col = _find_col(df, ("serious", "seriousness", "seriousnessdeath"))
+    week_col = _find_col(df, ("week", "event_week", "event_dt_week"))
+    if drug_col is None or react_col is None or case_col is None:
+        raise ValueError("Need drug, reaction and case id columns. Columns present: " + ", ".join(df.columns))
+
+    case_ids = pd.to_numeric(df[case_col], errors="coerce")
+    df = df[case_ids.notna()]
+    case_ids = case_ids[case_ids.notna()].astype(np.int64).to_numpy()
+
+    ids, pos = np.unique(case_ids, return_inverse=True)
+    n_ids = len(ids)
+
+    drug_keys = df[drug_col].fillna("").str.upper().str.strip().to_numpy(dtype=str)
+    pt_keys = df[react_col].fillna("").str.upper().str.strip().to_numpy(dtype=str)
+    drug_vocab, drug_offsets, drug_post = _postings(drug_keys, pos, n_ids)
+    pt_vocab, pt_offsets, pt_post = _postings(pt_keys, pos, n_ids)
+
+    # per-case attributes: take the first row seen for each case
+    _, first_row = np.unique(pos, return_index=True)
+
+    week_code = np.full(n_ids, -1, dtype=np.int32)
+    week_vocab = np.array([], dtype=str)
+    if week_col:
+        weeks = df[week_col].fillna("").astype(str).to_numpy()[first_row]
+        valid = np.char.find(weeks.astype(str), "/") == 10
+        week_vocab, codes = np.unique(weeks[valid].astype(str), return_inverse=True)
+        week_code[valid] = codes
+
+    serious = np.zeros(n_ids, dtype=bool)
+    if serious_col:
+        flags = df[serious_col].fillna("").str.upper().isin(SERIOUS_VALUES).to_numpy()
+        # a case is serious if any of its rows says so
+        serious[pos[flags]] = True
+
+    if os.path.dirname(out_path):
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    np.savez(
+        out_path,
+        ids=ids,
+        drug_vocab=drug_vocab, drug_offsets=drug_offsets, drug_post=drug_post,
+        pt_vocab=pt_vocab, pt_offsets=pt_offsets, pt_post=pt_post,
+        week_vocab=week_vocab.astype(str), week_code=week_code,
+        serious_bits=np.packbits(serious),
+    )
+    return CaseIndex.load(out_path)
+
+
+def _intersect_sorted(a, b):
+    """Intersect two sorted unique arrays by probing the larger with the smaller."""
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) == 0:
+        return a
+    idx = np.searchsorted(b, a)
+    idx[idx == len(b)] = len(b) - 1
+    return a[b[idx] == a]
+
+
+class CaseIndex:
+    def __init__(self, arrays):
+        self.ids = arrays["ids"]
+        self.drug_vocab = arrays["drug_vocab"]
+        self.drug_offsets = arrays["drug_offsets"]
+        self.drug_post = arrays["drug_post"]
+        self.pt_vocab = arrays["pt_vocab"]
+        self.pt_offsets = arrays["pt_offsets"]
+        self.pt_post = arrays["pt_post"]
+        self.week_vocab = arrays["week_vocab"]
+        self.week_code = arrays["week_code"]
+        self.serious = np.unpackbits(arrays["serious_bits"], count=len(self.ids)).astype(bool)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            return cls({k: z[k] for k in z.files})
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _lookup(self, vocab, offsets, post, name):
+        key = str(name).upper().strip()
+        i = np.searchsorted(vocab, key)
+        if i == len(vocab) or vocab[i] != key:
+            return post[:0]
+        return post[offsets[i]:offsets[i + 1]]
+
+    def drug_cases(self, drug):
+        return self._lookup(self.drug_vocab, self.drug_offsets, self.drug_post, drug)
+
+    def pt_cases(self, pt):
+        return self._lookup(self.pt_vocab, self.pt_offsets, self.pt_post, pt)
+
+    def _week_range(self, week_from, week_to):
+        """Map inclusive date/week bounds onto a [lo, hi) range of week codes."""
+        # a week belongs to the range if it overlaps it: ends on or after week_from
+        # and starts on or before week_to (weeks don't overlap, so both lists are sorted)
+        starts = np.array([w[:10] for w in self.week_vocab], dtype=str)
+        ends = np.array([w[11:] for w in self.week_vocab], dtype=str)
+        lo = 0 if week_from is None else np.searchsorted(ends, str(week_from)[:10], side="left")
+        hi = len(starts) if week_to is None else np.searchsorted(starts, str(week_to)[:10], side="right")
+        return lo, hi
+
+    def query_positions(self, drug=None, pt=None, week_from=None, week_to=None, serious=None):
+        lists = []
+        if drug is not None:
+            lists.append(self.drug_cases(drug))
+        if pt is not None:
+            lists.append(self.pt_cases(pt))
+
+        if lists:
+            lists.sort(key=len)
+            pos = lists[0]
+            for other in lists[1:]:
+                pos = _intersect_sorted(pos, other)
+        else:
+            pos = np.arange(len(self.ids), dtype=np.int32)
+
+        if week_from is not None or week_to is not None:
+            lo, hi = self._week_range(week_from, week_to)
+            wc = self.week_code[pos]
+            pos = pos[(wc >= lo) & (wc < hi)]
+        if serious is not None:
+            pos = pos[self.serious[pos] == bool(serious)]
+        return pos
+
+    def query(self, drug=None, pt=None, week_from=None, week_to=None, serious=None):
+        """Return the sorted primaryids matching every given condition."""
+        return self.ids[self.query_positions(drug, pt, week_from, week_to, serious)]
+
+
+def main_build(clustered_csv, out_path):
+    print("Building case index from:", clustered_csv)
+    t0 = time.perf_counter()
+    index = build_index(clustered_csv, out_path)
+    print(f"Indexed {len(index)} cases, {len(index.drug_vocab)} drugs, {len(index.pt_vocab)} PTs, "
+          f"{len(index.week_vocab)} weeks in {time.perf_counter() - t0:.2f}s")
+    print("Saved index to", out_path)
+
+
+def main_query(index_path, drug, pt, week_from, week_to, serious, limit):
+    index = CaseIndex.load(index_path)
+    t0 = time.perf_counter()
+    ids = index.query(drug=drug, pt=pt, week_from=week_from, week_to=week_to, serious=serious)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    print(f"{len(ids)} matching cases ({elapsed_ms:.2f} ms)")
+    for pid in ids[:limit]:
+        print(pid)
+    if len(ids) > limit:
+        print(f"... {len(ids) - limit} more")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    b = sub.add_parser("build", help="Build the index from a clustered CSV")
+    b.add_argument("--clustered", required=True)
+    b.add_argument("--out", default="outputs/case_index.npz")
+
+    q = sub.add_parser("query", help="Run a conjunctive query against a built index")
+    q.add_argument("--index", default="outputs/case_index.npz")
+    q.add_argument("--drug")
+    q.add_argument("--pt")
+    q.add_argument("--week_from", help="First week (YYYY-MM-DD, inclusive)")
+    q.add_argument("--week_to", help="Last week (YYYY-MM-DD, inclusive)")
+    seriousness = q.add_mutually_exclusive_group()
+    seriousness.add_argument("--serious", dest="serious", action="store_const", const=True, default=None,
+                             help="Only serious cases")
+    seriousness.add_argument("--non_serious", dest="serious", action="store_const", const=False,
+                             help="Only non-serious cases")
+    q.add_argument("--limit", type=int, default=50, help="Max ids to print")
+
+    args = parser.parse_args()
+    if args.cmd == "build":
+        main_build(args.clustered, args.out)
+    else:
+        main_query(args.index, args.drug, args.pt, args.week_from, args.week_to, args.serious, args.limit)
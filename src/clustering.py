@@ -1,7 +1,6 @@
 # src/clustering.py
 import argparse
 import numpy as np
-import pandas as pd
 
 def run_hdbscan(emb):
     import hdbscan
@@ -16,6 +15,7 @@ def run_dbscan(emb):
     return labels
 
 def main(emb_path, input_csv, out_csv):
+    import pandas as pd
     print("Loading embeddings:", emb_path)
     emb = np.load(emb_path).astype(np.float32)
     print("Embedding shape:", emb.shape)
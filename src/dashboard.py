@@ -1,7 +1,5 @@
 # src/dashboard.py
 import json, os
-import pandas as pd
-import matplotlib.pyplot as plt
 
 def make_dashboard(enriched_json, out_json="outputs/dashboard.json", plots_dir="outputs/plots", top_n=10):
     with open(enriched_json) as f:
@@ -16,6 +14,11 @@ def make_dashboard(enriched_json, out_json="outputs/dashboard.json", plots_dir="
     }
     os.makedirs(plots_dir, exist_ok=True)
 
+    # matplotlib is slow to import; only pay for it when a plot is drawn
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
     # create simple bar chart for top_n counts
     names = [f"{s['drug']} | {s['reaction']}" for s in signals]
     counts = [s["count"] for s in signals]
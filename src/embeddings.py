@@ -1,11 +1,24 @@
 # src/embeddings.py
 import argparse
-import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from tqdm import tqdm
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+# loaded models, kept for the life of the process (the warm worker reuses them across requests)
+_models = {}
+
+def get_model(name=MODEL_NAME):
+    # sentence_transformers pulls in torch; import it only when a model is actually needed
+    if name not in _models:
+        from sentence_transformers import SentenceTransformer
+        _models[name] = SentenceTransformer(name)
+    return _models[name]
+
+def encode(texts, name=MODEL_NAME, batch_size=64, show_progress_bar=False):
+    return get_model(name).encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar)
 
 def main(input_csv, out_path="data/embeddings.npy"):
+    import pandas as pd
     print("Loading dataset:", input_csv)
     df = pd.read_csv(input_csv)
 
@@ -15,10 +28,10 @@ def main(input_csv, out_path="data/embeddings.npy"):
     texts = df["ae_text"].fillna("").astype(str).tolist()
 
     print("Loading embedding model (this may take 5–10 seconds)...")
-    model = SentenceTransformer("all-MiniLM-L6-v2")
+    get_model()
 
     print("Encoding", len(texts), "rows...")
-    embeddings = model.encode(texts, batch_size=64, show_progress_bar=True)
+    embeddings = encode(texts, show_progress_bar=True)
 
     np.save(out_path, embeddings)
     print("Saved embeddings to", out_path)
@@ -0,0 +1,157 @@
+# src/hierarchy_rollup.py
+"""
+Drug-class and MedDRA hierarchy roll-up of signal counts.
+
+Counts drug x PT pairs once as a sparse leaf matrix C, then rolls it up to every
+hierarchy level in a single product:
+
+    M = D.T @ C @ P
+
+D (drugs x drug labels) and P (PTs x PT labels) are stacked one-hot mapping
+matrices: an identity block for the leaf level plus one block per level column
+in the mapping files. Every (drug level, PT level) combination comes out of M.
+Margins are rolled up the same way, so PRR/ROR are computed for all levels in
+one vectorized call.
+
+Counts are drug-reaction records (as in detect_signals), so a case reporting
+two drugs of the same class counts twice at the class level.
+
+Mapping files are CSVs whose first column is the leaf name (drugname or PT) and
+whose remaining columns are levels, e.g.
+  drug_map.csv: drugname,class
+  pt_map.csv:   pt,hlt,hlgt,soc
+A leaf may appear on several rows (multi-class drugs, secondary MedDRA paths).
+
+Usage:
+  python src/hierarchy_rollup.py --input data/faers_clustered.csv --drug_map data/drug_map.csv \
+      --pt_map data/pt_map.csv --out outputs/signals_rollup.csv
+"""
+
+import argparse
+import os
+import numpy as np
+
+# pandas and scipy (and signal_detection, which imports pandas) are imported
+# inside the functions that use them, so --help and argument errors return fast
+
+
+def _clean(series):
+    return series.fillna("").astype(str).str.upper().str.strip()
+
+
+def leaf_counts(df, drug_col, react_col):
+    """Sparse drug x PT count matrix plus the leaf vocabularies."""
+    import pandas as pd
+    from scipy import sparse
+
+    drugs = _clean(df[drug_col])
+    pts = _clean(df[react_col])
+    keep = (drugs != "") & (pts != "")
+    drug_codes, drug_vocab = pd.factorize(drugs[keep], sort=True)
+    pt_codes, pt_vocab = pd.factorize(pts[keep], sort=True)
+    counts = sparse.coo_matrix(
+        (np.ones(len(drug_codes), dtype=np.int64), (drug_codes, pt_codes)),
+        shape=(len(drug_vocab), len(pt_vocab)),
+    ).tocsr()
+    counts.sum_duplicates()
+    return counts, np.asarray(drug_vocab), np.asarray(pt_vocab)
+
+
+def level_matrix(leaf_vocab, leaf_level, mapping=None):
+    """
+    Stacked one-hot matrix (leaves x labels) and a DataFrame of (level, name)
+    describing each label column. The leaf level itself comes first.
+    """
+    import pandas as pd
+    from scipy import sparse
+
+    n = len(leaf_vocab)
+    blocks = [sparse.identity(n, dtype=np.int64, format="csr")]
+    labels = [pd.DataFrame({"level": leaf_level, "name": leaf_vocab})]
+
+    if mapping is not None and len(mapping.columns) > 1:
+        key_col = mapping.columns[0]
+        leaf_index = pd.Index(leaf_vocab)
+        keys = _clean(mapping[key_col])
+        for col in mapping.columns[1:]:
+            names = mapping[col].fillna("").astype(str).str.strip()
+            rows = leaf_index.get_indexer(keys)
+            ok = (rows >= 0) & (names != "").to_numpy()
+            codes, vocab = pd.factorize(names[ok], sort=True)
+            block = sparse.coo_matrix(
+                (np.ones(ok.sum(), dtype=np.int64), (rows[ok], codes)),
+                shape=(n, len(vocab)),
+            ).tocsr()
+            # duplicate mapping rows must not count a leaf twice
+            block.data[:] = 1
+            blocks.append(block)
+            labels.append(pd.DataFrame({"level": col.lower(), "name": np.asarray(vocab)}))
+
+    return sparse.hstack(blocks, format="csr"), pd.concat(labels, ignore_index=True)
+
+
+def rollup(df, drug_col, react_col, drug_map=None, pt_map=None, min_count=5):
+    import pandas as pd
+    from signal_detection import disproportionality
+
+    counts, drug_vocab, pt_vocab = leaf_counts(df, drug_col, react_col)
+    D, drug_labels = level_matrix(drug_vocab, "drug", drug_map)
+    P, pt_labels = level_matrix(pt_vocab, "pt", pt_map)
+
+    M = (D.T @ counts @ P).tocoo()
+    drug_tot = D.T @ np.asarray(counts.sum(axis=1)).ravel()
+    pt_tot = P.T @ np.asarray(counts.sum(axis=0)).ravel()
+    n = counts.sum()
+
+    keep = M.data >= min_count
+    rows, cols, a = M.row[keep], M.col[keep], M.data[keep]
+
+    out = pd.DataFrame({
+        "drug_level": drug_labels["level"].to_numpy()[rows],
+        "drug": drug_labels["name"].to_numpy()[rows],
+        "pt_level": pt_labels["level"].to_numpy()[cols],
+        "pt": pt_labels["name"].to_numpy()[cols],
+        "count": a,
+        "drug_total": drug_tot[rows],
+        "pt_total": pt_tot[cols],
+    })
+    out = pd.concat([out, disproportionality(a, out["drug_total"], out["pt_total"], n)], axis=1)
+    return out.sort_values(["drug_level", "pt_level", "count"], ascending=[True, True, False], ignore_index=True)
+
+
+def main(input_csv, drug_map_csv, pt_map_csv, out_csv, min_count):
+    import pandas as pd
+    from signal_detection import choose_columns
+
+    print("Loading clustered data:", input_csv)
+    df = pd.read_csv(input_csv, dtype=str)
+
+    drug_col, react_col = choose_columns(df)
+    if drug_col is None or react_col is None:
+        print("ERROR: Could not find drug or reaction column in the input CSV.")
+        print("Columns present:", list(df.columns)[:60])
+        raise SystemExit(1)
+
+    drug_map = pd.read_csv(drug_map_csv, dtype=str) if drug_map_csv else None
+    pt_map = pd.read_csv(pt_map_csv, dtype=str) if pt_map_csv else None
+
+    result = rollup(df, drug_col, react_col, drug_map, pt_map, min_count=min_count)
+
+    out_dir = os.path.dirname(out_csv)
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+
+    print(f"Found {len(result)} level pairs (min_count={min_count}). Saving to {out_csv}")
+    result.to_csv(out_csv, index=False)
+    print(result.groupby(["drug_level", "pt_level"]).size().to_string())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", required=True, help="Path to clustered CSV")
+    parser.add_argument("--drug_map", help="CSV: drugname,<level>,... (e.g. drugname,class)")
+    parser.add_argument("--pt_map", help="CSV: pt,<level>,... (e.g. pt,hlt,hlgt,soc)")
+    parser.add_argument("--out", required=True, help="Output CSV for rolled-up signals")
+    parser.add_argument("--min_count", type=int, default=5, help="Minimum count threshold at any level")
+    args = parser.parse_args()
+    main(args.input, args.drug_map, args.pt_map, args.out, args.min_count)
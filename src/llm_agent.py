@@ -4,11 +4,14 @@ LLM Agent Stub (offline)
 Summarizes detected signals using simple rule-based logic.
 Usage:
 python src/llm_agent.py --signals outputs/signals_detected.csv --clustered data/faers_clustered.csv --out outputs/signals_with_summaries.json
+python src/llm_agent.py --signals outputs/signals_detected.csv --clustered data/faers_clustered.csv --clusters outputs/cluster_summaries.json --out outputs/signals_with_summaries.json
+python src/llm_agent.py --signals outputs/signals_detected.csv --clustered data/faers_clustered.csv --out outputs/signals_with_summaries.json --compact_dir ui/public
 """
 
 import argparse
 import json
-import pandas as pd
+
+import payload
 
 
 def summarize_signal(drug, reaction, count):
@@ -26,7 +29,33 @@ def summarize_signal(drug, reaction, count):
     return summary
 
 
-def main(signals_csv, clustered_csv, out_json):
+def summarize_cluster(cluster):
+    """
+    Offline cluster summarizer over a cluster summary from signal_detection.
+    """
+    drugs = ", ".join(d["drug"] for d in cluster["top_drugs"][:3]) or "n/a"
+    reactions = ", ".join(r["reaction"] for r in cluster["top_reactions"][:3]) or "n/a"
+    summary = (
+        f"Cluster **{cluster['cluster']}** groups {cluster['size']} reports "
+        f"({cluster['share_of_reports'] * 100:.1f}% of all reports).\n\n"
+        f"- Dominant drugs: {drugs}\n"
+        f"- Dominant reactions: {reactions}\n"
+    )
+    if cluster["signal_pairs"]:
+        top = cluster["signal_pairs"][0]
+        summary += (
+            f"- Most enriched pair: {top['drug']} / {top['reaction']} "
+            f"({top['count']} reports, {top['enrichment']:.1f}x background)\n"
+        )
+    if cluster["growth"] is not None:
+        summary += f"- Recent growth: {cluster['recent_count']} vs {cluster['prior_count']} reports ({cluster['growth']:.2f}x)"
+    else:
+        summary += f"- Recent growth: {cluster['recent_count']} recent reports, none in the prior window"
+    return summary
+
+
+def main(signals_csv, clustered_csv, out_json, clusters_json=None, compact_dir=None):
+    import pandas as pd
     print("Loading detected signals:", signals_csv)
     sigs = pd.read_csv(signals_csv)
 
@@ -54,10 +83,29 @@ def main(signals_csv, clustered_csv, out_json):
         "signals": results
     }
 
+    if clusters_json:
+        print("Loading cluster summaries:", clusters_json)
+        with open(clusters_json, encoding="utf-8") as f:
+            clusters = json.load(f)["clusters"]
+        output["clusters"] = [
+            {
+                "cluster": c["cluster"],
+                "size": c["size"],
+                "growth": c["growth"],
+                "summary": summarize_cluster(c)
+            }
+            # noise (-1) is background, not a cluster; older summary files may still contain it
+            for c in clusters if str(c["cluster"]) != "-1"
+        ]
+
     print(f"Saving summarized signals to {out_json}")
     with open(out_json, "w", encoding="utf-8") as f:
         json.dump(output, f, indent=2)
 
+    if compact_dir:
+        path = payload.write_compact(results, compact_dir)
+        print(f"Saving compact dashboard payload to {path}")
+
     print("Done.")
 
 
@@ -66,5 +114,7 @@ if __name__ == "__main__":
     parser.add_argument("--signals", required=True)
     parser.add_argument("--clustered", required=True)
     parser.add_argument("--out", required=True)
+    parser.add_argument("--clusters", help="cluster_summaries.json from signal_detection")
+    parser.add_argument("--compact_dir", help="Also write the compact dashboard payload here (e.g. ui/public)")
     args = parser.parse_args()
-    main(args.signals, args.clustered, args.out)
+    main(args.signals, args.clustered, args.out, args.clusters, args.compact_dir)
@@ -0,0 +1,301 @@
+# src/parallel.py
+"""
+Partition-parallel execution for signal counting and enrichment.
+
+Rows are hash-partitioned by case id, so every row of a case lands in the same
+partition. The parent does no per-row work of its own:
+
+  1. workers hash contiguous chunks of the case id column into a shared-memory
+     partition array (one int8/int16 per row)
+  2. each worker selects its own partition's rows, encodes them locally
+     (factorize / upper-casing / matching against the signal keys) and returns
+     partial tables keyed by *values* (local vocabularies + counts)
+  3. the parent merges the partial vocabularies and counts; this costs
+     O(unique keys), not O(rows)
+
+Workers read the input columns through fork's copy-on-write memory, so nothing
+is pickled per row. Where fork is unavailable (Windows, macOS default) the
+parent hashes and slices the columns itself and ships each partition to its
+worker, which is correct but leaves more work on the parent.
+
+Merged results are identical to the serial pandas paths. Every parallel run
+reports its wall time and, per worker, the partition's row count and the time
+spent on it (load balance). Scaling efficiency needs a baseline, so it is only
+measured under --verify, which also runs the serial path: speedup = serial / parallel wall time,
+efficiency = (one-worker time / parallel wall time) / workers, where the
+one-worker time is the serial path or, for enrichment, the same aggregation
+on a single in-process partition. Wall time starts at the entry of
+pair_counts / enrich_stats and includes pool startup.
+"""
+
+import multiprocessing as mp
+import os
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+# columns (pandas Series) inherited by forked workers; set only while a pool is running
+_SOURCE = {}
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _fork_context():
+    try:
+        return mp.get_context("fork")
+    except ValueError:
+        return None
+
+
+def _part_dtype(workers):
+    return np.int8 if workers < 128 else np.int16
+
+
+def _hash_partition(case_ids, workers):
+    """hash(case id) % workers for a Series of case ids, or row position when there are none."""
+    if case_ids is None:
+        return None
+    h = pd.util.hash_pandas_object(case_ids, index=False).to_numpy()
+    return (h % np.uint64(workers)).astype(_part_dtype(workers))
+
+
+def _hash_chunk(task):
+    # phase 1 (forked workers): hash rows [lo, hi) of the case column into the shared partition array
+    shm_name, n, workers, lo, hi = task
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        part = np.ndarray((n,), dtype=_part_dtype(workers), buffer=shm.buf)
+        case = _SOURCE.get("_case")
+        if case is None:
+            part[lo:hi] = np.arange(lo, hi) % workers
+        else:
+            part[lo:hi] = _hash_partition(case.iloc[lo:hi], workers)
+        del part
+    finally:
+        shm.close()
+
+
+def _timed(fn, cols, rows, params):
+    t0 = time.perf_counter()
+    result = fn(cols, rows, **params)
+    return result, len(rows), time.perf_counter() - t0
+
+
+def _select_rows(task):
+    # phase 2 (forked workers): pick this worker's rows and run fn on them
+    fn, shm_name, n, workers, w, params = task
+    t0 = time.perf_counter()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        part = np.ndarray((n,), dtype=_part_dtype(workers), buffer=shm.buf)
+        rows = np.flatnonzero(part == w)
+        del part
+    finally:
+        shm.close()
+    cols = {k: s.iloc[rows] for k, s in _SOURCE.items() if k != "_case"}
+    result = fn(cols, rows, **params)
+    return result, len(rows), time.perf_counter() - t0
+
+
+def _run_shipped(task):
+    return _timed(*task)
+
+
+def run_partitioned(fn, columns, case_ids, workers, **params):
+    """
+    Hash-partition rows by `case_ids` (a Series, or None to spread rows by position)
+    and run fn(cols, rows, **params) once per partition, where cols holds this
+    partition's slice of each Series in `columns` and rows its (ascending) row positions.
+    Returns (partial results, per-partition row counts, per-partition seconds).
+    """
+    global _SOURCE
+    workers = max(1, int(workers))
+    n = len(next(iter(columns.values())))
+    ctx = _fork_context()
+
+    if workers == 1:
+        # single partition: run in-process, the baseline for scaling efficiency
+        return _unzip([_timed(fn, dict(columns), np.arange(n), params)])
+
+    if ctx is None:
+        part = _hash_partition(case_ids, workers)
+        if part is None:
+            part = (np.arange(n) % workers).astype(_part_dtype(workers))
+        tasks = []
+        for w in range(workers):
+            rows = np.flatnonzero(part == w)
+            tasks.append((fn, {k: s.iloc[rows] for k, s in columns.items()}, rows, params))
+        with mp.get_context().Pool(workers) as pool:
+            return _unzip(pool.map(_run_shipped, tasks))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, n * np.dtype(_part_dtype(workers)).itemsize))
+    _SOURCE = dict(columns, _case=case_ids)
+    try:
+        # workers are forked here, inheriting _SOURCE
+        with ctx.Pool(workers) as pool:
+            bounds = np.linspace(0, n, workers + 1).astype(int)
+            pool.map(_hash_chunk, [(shm.name, n, workers, bounds[w], bounds[w + 1]) for w in range(workers)])
+            return _unzip(pool.map(_select_rows, [(fn, shm.name, n, workers, w, params) for w in range(workers)]))
+    finally:
+        _SOURCE = {}
+        shm.close()
+        shm.unlink()
+
+
+def _unzip(timed):
+    partials, rows, seconds = zip(*timed)
+    return list(partials), list(rows), list(seconds)
+
+
+def _stats(workers, t0, rows, seconds):
+    return {"workers": max(1, int(workers)), "wall": time.perf_counter() - t0, "rows": rows, "seconds": seconds}
+
+
+def report(stats, label):
+    """
+    Speedup is against the serial path; scaling efficiency is against `single`
+    (the same partitioned algorithm on one worker) when the serial path is a
+    different algorithm, else against the serial path.
+    """
+    line = f"{label}: {stats['workers']} workers, wall {stats['wall']:.2f}s"
+    if "serial" in stats:
+        speedup = stats["serial"] / stats["wall"] if stats["wall"] else float("inf")
+        line += f", serial {stats['serial']:.2f}s, speedup {speedup:.2f}x"
+        base = stats.get("single", stats["serial"])
+        if "single" in stats:
+            line += f", 1 worker {base:.2f}s"
+        scaling = base / stats["wall"] if stats["wall"] else float("inf")
+        line += f", scaling efficiency {scaling / stats['workers'] * 100:.0f}%"
+    else:
+        line += " (scaling efficiency is measured with --verify, which also runs the serial path)"
+    print(line)
+    rows = np.asarray(stats["rows"])
+    print(f"  rows per worker: {', '.join(str(int(n)) for n in rows)}"
+          f" (largest / mean {rows.max() / max(1, rows.mean()):.2f})")
+    print(f"  seconds per worker: {', '.join(f'{t:.2f}' for t in stats['seconds'])}")
+
+
+def _merge_vocab(local_vocabs):
+    """Sorted union of the partitions' vocabularies, plus a local->global code map per partition."""
+    merged = np.unique(np.concatenate([np.asarray(v, dtype=object) for v in local_vocabs]))
+    return merged, [np.searchsorted(merged, np.asarray(v, dtype=object)).astype(np.int64) for v in local_vocabs]
+
+
+# ---------------------------------------------------------------- pair counts
+
+def _pair_counts_part(cols, rows):
+    d_codes, drugs = pd.factorize(cols["drug"], sort=True)
+    p_codes, pts = pd.factorize(cols["pt"], sort=True)
+    keep = (d_codes >= 0) & (p_codes >= 0)
+    n_pts = max(1, len(pts))
+    keys, counts = np.unique(d_codes[keep].astype(np.int64) * n_pts + p_codes[keep], return_counts=True)
+    return np.asarray(drugs, dtype=object), np.asarray(pts, dtype=object), keys // n_pts, keys % n_pts, counts
+
+
+def pair_counts(df, drug_col, react_col, case_col, workers):
+    """Parallel equivalent of df.groupby([drug_col, react_col]).size().reset_index(name="count")."""
+    t0 = time.perf_counter()
+    partials, rows, seconds = run_partitioned(
+        _pair_counts_part, {"drug": df[drug_col], "pt": df[react_col]},
+        df[case_col] if case_col else None, workers,
+    )
+
+    drugs, drug_maps = _merge_vocab([p[0] for p in partials])
+    pts, pt_maps = _merge_vocab([p[1] for p in partials])
+    keys = np.concatenate([dm[p[2]] * len(pts) + pm[p[3]] for p, dm, pm in zip(partials, drug_maps, pt_maps)])
+    counts = np.concatenate([p[4] for p in partials])
+    keys, inv = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inv, weights=counts).astype(np.int64)
+    out = pd.DataFrame({
+        drug_col: drugs[keys // max(1, len(pts))],
+        react_col: pts[keys % max(1, len(pts))],
+        "count": counts,
+    })
+    return out, _stats(workers, t0, rows, seconds)
+
+
+# ---------------------------------------------------------------- enrichment
+
+def _enrich_part(cols, rows, keys, serious_values, sample_n):
+    n_keys = len(keys)
+    drug = cols["drug"].str.upper().fillna("")
+    reac = cols["pt"].str.upper().fillna("")
+    sig = pd.MultiIndex.from_tuples(keys).get_indexer(pd.MultiIndex.from_arrays([drug, reac]))
+    keep = sig >= 0
+    sig, rows = sig[keep], rows[keep]
+
+    out = {"total": np.bincount(sig, minlength=n_keys)}
+    if "serious" in cols:
+        flags = cols["serious"][keep].fillna("").str.upper().isin(serious_values).to_numpy()
+        out["serious"] = np.bincount(sig, weights=flags, minlength=n_keys)
+
+    if "week" in cols:
+        w_codes, weeks = pd.factorize(cols["week"][keep], sort=True)
+        has = w_codes >= 0
+        n_w = max(1, len(weeks))
+        wk, wc = np.unique(sig[has].astype(np.int64) * n_w + w_codes[has], return_counts=True)
+        out["weeks"] = (wk // n_w, np.asarray(weeks, dtype=object)[wk % n_w], wc)
+
+    if "case" in cols:
+        # first occurrence of each (signal, case), then the earliest sample_n per signal;
+        # a case never spans partitions, so partition-local uniqueness is global uniqueness
+        c_codes, cases = pd.factorize(cols["case"][keep])
+        has = c_codes >= 0
+        s, c, r = sig[has].astype(np.int64), c_codes[has], rows[has]
+        _, first = np.unique(s * max(1, len(cases)) + c, return_index=True)
+        s, c, r = s[first], c[first], r[first]
+        order = np.lexsort((r, s))
+        s, c, r = s[order], c[order], r[order]
+        take = (np.arange(len(s)) - np.searchsorted(s, s)) < sample_n
+        out["sample"] = (s[take], r[take], np.asarray(cases, dtype=object)[c[take]])
+    return out
+
+
+def enrich_stats(df, keys, drug_col, react_col, case_col, serious_col, week_col, serious_values, workers, sample_n):
+    """
+    Per-key (upper-cased drug, reaction) aggregates needed by signal_enrichment:
+    row count, serious count, weekly counts and the first sample_n unique case ids.
+    """
+    t0 = time.perf_counter()
+    columns = {"drug": df[drug_col], "pt": df[react_col]}
+    if serious_col:
+        columns["serious"] = df[serious_col]
+    if week_col:
+        columns["week"] = df[week_col]
+    if case_col:
+        columns["case"] = df[case_col]
+    partials, rows, seconds = run_partitioned(
+        _enrich_part, columns, df[case_col] if case_col else None, workers,
+        keys=keys, serious_values=serious_values, sample_n=sample_n,
+    )
+
+    n_keys = len(keys)
+    total = np.sum([p["total"] for p in partials], axis=0)
+    n_serious = np.sum([p["serious"] for p in partials], axis=0) if serious_col else np.zeros(n_keys)
+
+    trends = [[] for _ in range(n_keys)]
+    if week_col:
+        weeks = pd.DataFrame({
+            "sig": np.concatenate([p["weeks"][0] for p in partials]),
+            "week": np.concatenate([p["weeks"][1] for p in partials]),
+            "count": np.concatenate([p["weeks"][2] for p in partials]),
+        })
+        weeks = weeks.groupby(["sig", "week"], sort=True)["count"].sum()
+        for (k, week), n in weeks.items():
+            trends[k].append({week_col: week, "count": int(n)})
+
+    samples = [[] for _ in range(n_keys)]
+    if case_col:
+        s = np.concatenate([p["sample"][0] for p in partials])
+        r = np.concatenate([p["sample"][1] for p in partials])
+        c = np.concatenate([p["sample"][2] for p in partials])
+        order = np.lexsort((r, s))
+        for k, case in zip(s[order], c[order]):
+            if len(samples[k]) < sample_n:
+                samples[k].append(case)
+
+    result = {"total": total, "serious": n_serious, "trends": trends, "samples": samples}
+    return result, _stats(workers, t0, rows, seconds)
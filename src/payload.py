@@ -0,0 +1,129 @@
+# src/payload.py
+"""
+Compact columnar signal payload for the dashboard UI.
+
+Writes two files next to each other:
+  signals_compact.json    string tables + column arrays, no whitespace
+  signals_summaries.json  summary strings aligned with the rows, fetched lazily by the UI
+
+signals_compact.json layout:
+  {
+    "version": 1,
+    "total_signals": N,
+    "strings": {"drug": [...], "reaction": [...]},     # deduplicated, sorted
+    "columns": {"drug": [i, ...], "reaction": [i, ...], "count": [...], ...},
+    "summaries": "signals_summaries.json"               # null when there are none
+  }
+Rows are sorted by count (descending). Extra numeric fields present on the
+signals (serious_pct, prr, ror, ...) become extra columns; nested fields
+(weekly_trend, sample_case_ids, clusters) stay in the full JSON.
+
+Each export replaces both files: an export without summaries removes a
+signals_summaries.json left by an earlier one, so the pair always matches.
+
+Usage (convert an existing signals JSON):
+  python src/payload.py --input ui/public/signals_with_summaries.json --out_dir ui/public
+Usage (synthetic payload for load testing, see ui/scripts/bench-payload.mjs):
+  python src/payload.py --synthetic 100000 --out_dir /tmp/pv-bench
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+
+COMPACT_NAME = "signals_compact.json"
+SUMMARIES_NAME = "signals_summaries.json"
+STRING_COLUMNS = ("drug", "reaction")
+SKIP_FIELDS = ("summary",)
+
+
+def _clean_number(v):
+    # JSON has no inf/nan
+    if isinstance(v, float) and not math.isfinite(v):
+        return None
+    return v
+
+
+def to_compact(signals):
+    """Return (payload dict, summaries list or None) for a list of signal dicts."""
+    signals = sorted(signals, key=lambda s: s["count"], reverse=True)
+
+    strings = {c: sorted({str(s[c]) for s in signals}) for c in STRING_COLUMNS}
+    lookup = {c: {v: i for i, v in enumerate(strings[c])} for c in STRING_COLUMNS}
+    columns = {c: [lookup[c][str(s[c])] for s in signals] for c in STRING_COLUMNS}
+
+    numeric = []
+    for s in signals[:1]:
+        numeric = [k for k, v in s.items()
+                   if k not in STRING_COLUMNS and k not in SKIP_FIELDS
+                   and (v is None or isinstance(v, (int, float))) and not isinstance(v, bool)]
+    for k in numeric:
+        columns[k] = [_clean_number(s.get(k)) for s in signals]
+
+    summaries = None
+    if any("summary" in s for s in signals):
+        summaries = [s.get("summary", "") for s in signals]
+
+    payload = {
+        "version": 1,
+        "total_signals": len(signals),
+        "strings": strings,
+        "columns": columns,
+        "summaries": SUMMARIES_NAME if summaries is not None else None,
+    }
+    return payload, summaries
+
+
+def write_compact(signals, out_dir):
+    payload, summaries = to_compact(signals)
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, COMPACT_NAME)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, separators=(",", ":"))
+    summaries_path = os.path.join(out_dir, SUMMARIES_NAME)
+    if summaries is not None:
+        with open(summaries_path, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, separators=(",", ":"))
+    elif os.path.exists(summaries_path):
+        # left by an earlier export with summaries; it no longer lines up with these rows
+        os.remove(summaries_path)
+    return path
+
+
+def synthetic_signals(n, n_drugs=2000, n_reactions=5000, seed=0):
+    """n random signals with enrichment-style metrics and summaries."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        drug = f"DRUG{rng.randrange(n_drugs):05d}"
+        reaction = f"Reaction {rng.randrange(n_reactions):05d}"
+        count = int(rng.paretovariate(1.5) * 5)
+        out.append({
+            "drug": drug,
+            "reaction": reaction,
+            "count": count,
+            "serious_pct": round(rng.random() * 100, 2),
+            "prr": round(rng.lognormvariate(0.5, 0.8), 3),
+            "ror": round(rng.lognormvariate(0.6, 0.9), 3),
+            "summary": f"Potential safety signal detected for **{drug}** associated with "
+                       f"the adverse reaction **{reaction}**.\n\n- Report count: {count}",
+        })
+    return out
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--input", help="signals JSON with a 'signals' list (llm_agent / signal_enrichment output)")
+    src.add_argument("--synthetic", type=int, help="Write N generated signals instead (load testing)")
+    p.add_argument("--out_dir", default="ui/public")
+    args = p.parse_args()
+    if args.synthetic:
+        signals = synthetic_signals(args.synthetic)
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            signals = json.load(f)["signals"]
+    path = write_compact(signals, args.out_dir)
+    print("Wrote compact payload:", path)
@@ -3,11 +3,17 @@
 Simple signal detection script.
 Usage:
   python src/signal_detection.py --input data/faers_clustered.csv --out outputs/signals_detected.csv
+  python src/signal_detection.py --input data/faers_clustered.csv --out outputs/signals_detected.csv --stratify
 """
 
 import argparse
+import json
 import os
-import pandas as pd
+import time
+import numpy as np
+
+# pandas (and parallel, which imports it) are imported inside the functions that use them,
+# so --help and argument errors return fast
 
 def choose_columns(df):
     # Accept several common name variants
@@ -25,14 +31,237 @@ def choose_columns(df):
 
     return drug_col, react_col
 
+def choose_case_column(df):
+    return next((c for c in df.columns if c.lower() in ("primaryid", "caseid", "report_id", "id")), None)
+
+def threshold_signals(pair_counts, min_count):
+    # basic threshold (changeable)
+    return pair_counts[pair_counts["count"] >= min_count].sort_values("count", ascending=False)
+
 def detect_signals(df, drug_col, react_col, min_count=5):
     # compute counts for drug - reaction pairs and per-cluster counts
     pair_counts = df.groupby([drug_col, react_col]).size().reset_index(name="count")
-    # basic threshold (changeable)
-    signals = pair_counts[pair_counts["count"] >= min_count].sort_values("count", ascending=False)
-    return signals
+    return threshold_signals(pair_counts, min_count)
+
+def detect_signals_parallel(df, drug_col, react_col, min_count=5, workers=None, verify=False):
+    import parallel
+    # same result as detect_signals, with pair counts computed over hash partitions of the cases
+    workers = workers or parallel.default_workers()
+    pair_counts, stats = parallel.pair_counts(df, drug_col, react_col, choose_case_column(df), workers)
+    signals = threshold_signals(pair_counts, min_count)
+    if verify:
+        t0 = time.perf_counter()
+        serial = detect_signals(df, drug_col, react_col, min_count=min_count)
+        stats["serial"] = time.perf_counter() - t0
+        # compare values only: the serial groupby keeps the input dtypes of the key columns
+        if not np.array_equal(serial.to_numpy(), signals.to_numpy()) or not serial.index.equals(signals.index):
+            raise AssertionError("Parallel signals differ from the serial path")
+        print("Verified: parallel signals identical to serial path")
+    return signals, stats
+
+def disproportionality(a, drug_total, pt_total, n):
+    import pandas as pd
+    # PRR and ROR (with 95% CI) from the 2x2 table of each drug - reaction pair.
+    # a = reports with both, drug_total / pt_total = margins, n = all reports.
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(drug_total, dtype=float) - a
+    c = np.asarray(pt_total, dtype=float) - a
+    d = float(n) - a - b - c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        prr = (a / (a + b)) / (c / (c + d))
+        ror = (a * d) / (b * c)
+        se = np.sqrt(1 / a + 1 / b + 1 / c + 1 / d)
+        ror_lo = np.exp(np.log(ror) - 1.96 * se)
+        ror_hi = np.exp(np.log(ror) + 1.96 * se)
+    return pd.DataFrame({"prr": prr, "ror": ror, "ror_lo95": ror_lo, "ror_hi95": ror_hi})
+
+# age bands (years) used for stratification; unknown age is its own band
+AGE_BINS = [0, 18, 45, 65, np.inf]
+
+def stratum_codes(df):
+    import pandas as pd
+    # one integer stratum per row: age band x sex x event year (unknowns kept as their own level)
+    n = len(df)
+    if "age" in df.columns:
+        age = pd.to_numeric(df["age"], errors="coerce")
+        age_band = pd.cut(age, AGE_BINS, right=False, labels=False).fillna(-1).astype(int)
+    else:
+        age_band = pd.Series(-1, index=df.index)
+    if "sex" in df.columns:
+        sex = df["sex"].fillna("").astype(str).str.upper().str.strip()
+        sex = sex.where(sex.isin(["M", "F"]), "U")
+    else:
+        sex = pd.Series("U", index=df.index)
+    if "event_dt" in df.columns:
+        year = pd.to_datetime(df["event_dt"], errors="coerce").dt.year.fillna(0).astype(int)
+    else:
+        year = pd.Series(0, index=df.index)
+    keys = pd.DataFrame({"age_band": age_band.to_numpy(), "sex": sex.to_numpy(), "year": year.to_numpy()}, index=range(n))
+    return keys.groupby(["age_band", "sex", "year"], sort=True).ngroup().to_numpy()
+
+def detect_signals_stratified(df, drug_col, react_col, min_count=5, chunk=200_000):
+    import pandas as pd
+    # Mantel-Haenszel adjusted PRR/ROR across age band x sex x year strata.
+    # The drug x PT x stratum count tensor is kept sparse as unique (stratum, drug, pt) cells;
+    # per-stratum drug and PT margins are dense (K strata is small).
+    df = df.dropna(subset=[drug_col, react_col])
+    strata = stratum_codes(df)
+    K = int(strata.max()) + 1 if len(strata) else 0
+    drug_codes, drugs = pd.factorize(df[drug_col])
+    pt_codes, pts = pd.factorize(df[react_col])
+    nd, npt = len(drugs), len(pts)
+
+    cells, a = np.unique((strata.astype(np.int64) * nd + drug_codes) * npt + pt_codes, return_counts=True)
+    k = cells // (nd * npt)
+    pair = cells % (nd * npt)
+
+    n_k = np.bincount(strata, minlength=K).astype(float)
+    D = np.bincount(drug_codes.astype(np.int64) * K + strata, minlength=nd * K).reshape(nd, K).astype(float)
+    P = np.bincount(pt_codes.astype(np.int64) * K + strata, minlength=npt * K).reshape(npt, K).astype(float)
+
+    pairs, inv = np.unique(pair, return_inverse=True)
+    count = np.bincount(inv, weights=a)
+    cand = count >= min_count
+    keep = cand[inv]
+    pairs, count = pairs[cand], count[cand]
+    inv = np.cumsum(cand)[inv[keep]] - 1
+    a, k, pair = a[keep].astype(float), k[keep], pair[keep]
+
+    # per-cell terms; cells with a_k = 0 only contribute through the margins below
+    Dk, Pk, nk = D[pair // npt, k], P[pair % npt, k], n_k[k]
+    m = len(pairs)
+    ror_num = np.bincount(inv, a * (nk - Dk - Pk + a) / nk, minlength=m)
+    ror_den = np.bincount(inv, a * (a - Dk - Pk) / nk, minlength=m)
+    prr_num = np.bincount(inv, a * (nk - Dk) / nk, minlength=m)
+    prr_den = np.bincount(inv, -a * Dk / nk, minlength=m)
 
-def main(input_csv, out_csv, min_count):
+    # sum_k D_k * P_k / n_k over all strata, chunked to bound the m x K temporary
+    pair_drug, pair_pt = pairs // npt, pairs % npt
+    margin = np.empty(m)
+    for s in range(0, m, chunk):
+        e = s + chunk
+        margin[s:e] = np.einsum("ik,ik->i", D[pair_drug[s:e]] / n_k, P[pair_pt[s:e]])
+
+    # the denominators are differences of similar sums; snap cancellation noise to an exact zero
+    ror_den += margin
+    prr_den += margin
+    ror_den[np.abs(ror_den) < 1e-9 * margin] = 0
+    prr_den[np.abs(prr_den) < 1e-9 * margin] = 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ror_mh = ror_num / ror_den
+        prr_mh = prr_num / prr_den
+
+    signals = pd.DataFrame({
+        drug_col: np.asarray(drugs)[pair_drug],
+        react_col: np.asarray(pts)[pair_pt],
+        "count": count.astype(int),
+    })
+    crude = disproportionality(count, D.sum(axis=1)[pair_drug], P.sum(axis=1)[pair_pt], n_k.sum())
+    signals = pd.concat([signals, crude], axis=1)
+    signals["prr_mh"] = prr_mh
+    signals["ror_mh"] = ror_mh
+    return signals.sort_values("count", ascending=False, ignore_index=True)
+
+def cluster_signals(df, drug_col, react_col, cluster_col="cluster", week_col="week", min_count=5, recent_weeks=4, top_n=5):
+    import pandas as pd
+    # Cluster-level concentration, enrichment vs background and weekly growth.
+    # Everything is derived from a single groupby over (cluster, drug, pt, week) codes.
+    # Returns (pairs DataFrame, list of per-cluster summary dicts).
+    # Rows without a cluster label are dropped; noise (label -1) counts towards the
+    # background totals but gets no pairs or summary of its own.
+    df = df.dropna(subset=[drug_col, react_col, cluster_col])
+    if df.empty:
+        # cluster column present but unlabelled (e.g. clustering not run yet)
+        return pd.DataFrame(columns=["cluster", drug_col, react_col, "count", "cluster_total", "concentration",
+                                     "enrichment", "recent_count", "prior_count"]), []
+    labels = df[cluster_col]
+    if pd.api.types.is_float_dtype(labels) and (labels % 1 == 0).all():
+        # NaN labels made pandas read the column as float
+        labels = labels.astype(np.int64)
+    cl_codes, clusters = pd.factorize(labels, sort=True)
+    noise = np.asarray(clusters.astype(str) == "-1")
+    d_codes, drugs = pd.factorize(df[drug_col])
+    p_codes, pts = pd.factorize(df[react_col])
+
+    # calendar week number since the first observed week; -1 when unknown
+    week_num = np.full(len(df), -1, dtype=np.int64)
+    week_starts = pd.Series(dtype="datetime64[ns]")
+    if week_col in df.columns:
+        starts = pd.to_datetime(df[week_col].astype(str).str[:10], errors="coerce", format="%Y-%m-%d")
+        valid = starts.notna().to_numpy()
+        if valid.any():
+            first = starts[valid].min()
+            week_num[valid] = ((starts[valid] - first).dt.days // 7).to_numpy()
+            week_starts = pd.Series(first + pd.to_timedelta(np.arange(week_num.max() + 1) * 7, unit="D"))
+
+    cells = pd.DataFrame({"c": cl_codes, "d": d_codes, "p": p_codes, "w": week_num})
+    cells = cells.groupby(["c", "d", "p", "w"], sort=False).size().rename("n").reset_index()
+
+    last = week_num.max()
+    cells["recent"] = np.where((cells["w"] >= 0) & (cells["w"] > last - recent_weeks), cells["n"], 0)
+    cells["prior"] = np.where((cells["w"] >= 0) & (cells["w"] <= last - recent_weeks)
+                              & (cells["w"] > last - 2 * recent_weeks), cells["n"], 0)
+
+    total = cells["n"].sum()
+    cluster_total = cells.groupby("c")["n"].sum()
+    pair_total = cells.groupby(["d", "p"])["n"].sum()
+
+    pairs = cells.groupby(["c", "d", "p"], sort=False)[["n", "recent", "prior"]].sum().reset_index()
+    pairs = pairs[(pairs["n"] >= min_count) & ~noise[pairs["c"].to_numpy()]]
+    conc = pairs["n"].to_numpy() / cluster_total.reindex(pairs["c"]).to_numpy()
+    background = pair_total.reindex(pd.MultiIndex.from_arrays([pairs["d"], pairs["p"]])).to_numpy() / total
+    pairs = pd.DataFrame({
+        "cluster": np.asarray(clusters)[pairs["c"]],
+        drug_col: np.asarray(drugs)[pairs["d"]],
+        react_col: np.asarray(pts)[pairs["p"]],
+        "count": pairs["n"].to_numpy(),
+        "cluster_total": cluster_total.reindex(pairs["c"]).to_numpy(),
+        "concentration": conc,
+        "enrichment": conc / background,
+        "recent_count": pairs["recent"].to_numpy(),
+        "prior_count": pairs["prior"].to_numpy(),
+    }).sort_values(["cluster", "enrichment", "count"], ascending=[True, False, False], ignore_index=True)
+
+    by_drug = cells.groupby(["c", "d"])["n"].sum()
+    by_pt = cells.groupby(["c", "p"])["n"].sum()
+    by_week = cells[cells["w"] >= 0].groupby(["c", "w"])["n"].sum()
+    growth = cells.groupby("c")[["recent", "prior"]].sum()
+
+    pairs_by_cluster = dict(list(pairs.groupby("cluster", sort=False)))
+    empty_pairs = pairs.iloc[:0]
+
+    summaries = []
+    for c, size in cluster_total.items():
+        if noise[c]:
+            continue
+        top_d = by_drug.loc[c].nlargest(top_n)
+        top_p = by_pt.loc[c].nlargest(top_n)
+        label = clusters[c]
+        cl_pairs = pairs_by_cluster.get(label, empty_pairs)
+        trend = by_week.loc[c] if c in by_week.index.get_level_values(0) else pd.Series(dtype=int)
+        recent, prior = int(growth.loc[c, "recent"]), int(growth.loc[c, "prior"])
+        summaries.append({
+            "cluster": int(label) if np.issubdtype(type(label), np.integer) else label,
+            "size": int(size),
+            "share_of_reports": round(float(size) / total, 4),
+            "top_drugs": [{"drug": drugs[d], "count": int(n), "concentration": round(n / size, 4)} for d, n in top_d.items()],
+            "top_reactions": [{"reaction": pts[p], "count": int(n), "concentration": round(n / size, 4)} for p, n in top_p.items()],
+            "signal_pairs": [
+                {"drug": r[drug_col], "reaction": r[react_col], "count": int(r["count"]),
+                 "concentration": round(float(r["concentration"]), 4), "enrichment": round(float(r["enrichment"]), 3)}
+                for _, r in cl_pairs.iterrows()
+            ],
+            "weekly_trend": [{"week": f"{week_starts[w].date()}/{(week_starts[w] + pd.Timedelta(days=6)).date()}", "count": int(n)}
+                             for w, n in trend.items()],
+            "recent_count": recent,
+            "prior_count": prior,
+            "growth": round(recent / prior, 3) if prior else None,
+        })
+    return pairs, summaries
+
+def main(input_csv, out_csv, min_count, stratify=False, clusters_out=None, workers=1, verify=False):
+    import pandas as pd
+    import parallel
     print("Loading clustered data:", input_csv)
     df = pd.read_csv(input_csv)
 
@@ -44,13 +273,15 @@ def main(input_csv, out_csv, min_count):
 
     print("Using columns:", drug_col, "for drug, and", react_col, "for reaction/PT")
 
-    signals = detect_signals(df, drug_col, react_col, min_count=min_count)
-
-    # add a simple enrichment: top drug share in cluster for each signal (helpful heuristic)
-    # We attempt to join with cluster counts if cluster exists
-    if "cluster" in df.columns:
-        cluster_counts = df.groupby(["cluster"]).size().reset_index(name="cluster_total")
-        # we will not compute cluster-level concentration here to keep lightweight
+    if stratify:
+        signals = detect_signals_stratified(df, drug_col, react_col, min_count=min_count)
+        scored = df.dropna(subset=[drug_col, react_col])
+        print("Stratified by age band x sex x year:", len(np.unique(stratum_codes(scored))), "strata")
+    elif workers != 1:
+        signals, stats = detect_signals_parallel(df, drug_col, react_col, min_count=min_count, workers=workers, verify=verify)
+        parallel.report(stats, "Parallel pair counts")
+    else:
+        signals = detect_signals(df, drug_col, react_col, min_count=min_count)
 
     # ensure outputs folder exists
     out_dir = os.path.dirname(out_csv)
@@ -65,10 +296,28 @@ def main(input_csv, out_csv, min_count):
     else:
         print("No signals found with the current threshold.")
 
+    # cluster-level concentration / enrichment / growth, consumed by signal_enrichment and llm_agent;
+    # written after the signals so a problem here cannot lose the main output
+    if "cluster" in df.columns:
+        _, summaries = cluster_signals(df, drug_col, react_col, min_count=min_count)
+        if summaries:
+            clusters_out = clusters_out or os.path.join(out_dir, "cluster_summaries.json")
+            with open(clusters_out, "w", encoding="utf-8") as f:
+                json.dump({"total_clusters": len(summaries), "clusters": summaries}, f, indent=2)
+            print(f"Saved {len(summaries)} cluster summaries to {clusters_out}")
+        else:
+            print("No labelled clusters in the input; skipping cluster summaries")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--input", required=True, help="Path to clustered CSV")
     parser.add_argument("--out", required=True, help="Output CSV for detected signals")
     parser.add_argument("--min_count", type=int, default=5, help="Minimum count threshold for a signal")
+    parser.add_argument("--clusters_out", help="Output JSON for cluster summaries (default: cluster_summaries.json next to --out)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for partition-parallel counting (0 = all cores)")
+    parser.add_argument("--verify", action="store_true", help="With --workers, also run the serial path, check results match and report speedup and scaling efficiency")
+    parser.add_argument("--stratify", action="store_true", help="Add Mantel-Haenszel PRR/ROR adjusted for age band, sex and year")
     args = parser.parse_args()
-    main(args.input, args.out, args.min_count)
+    if args.stratify and (args.workers != 1 or args.verify):
+        parser.error("--stratify runs serially; it cannot be combined with --workers or --verify")
+    main(args.input, args.out, args.min_count, args.stratify, args.clusters_out, args.workers, args.verify)
@@ -1,13 +1,64 @@
 # src/signal_enrichment.py
-import argparse, os, json
-import pandas as pd
+import argparse, os, json, time
+
+SERIOUS_VALUES = ["Y","YES","1","SERIOUS","S"]
 
 def load_signals(path):
+    import pandas as pd
     return pd.read_csv(path)
 
-def enrich(signals_csv, clustered_csv, out_json, sample_n=5):
+def load_cluster_pairs(clusters_json):
+    # (DRUG, REACTION) -> clusters where the pair is concentrated, from signal_detection's cluster summaries
+    with open(clusters_json, encoding="utf-8") as f:
+        clusters = json.load(f)["clusters"]
+    by_pair = {}
+    for c in clusters:
+        for p in c["signal_pairs"]:
+            key = (str(p["drug"]).upper(), str(p["reaction"]).upper())
+            by_pair.setdefault(key, []).append({
+                "cluster": c["cluster"],
+                "count": p["count"],
+                "concentration": p["concentration"],
+                "enrichment": p["enrichment"],
+                "cluster_growth": c["growth"],
+            })
+    for v in by_pair.values():
+        v.sort(key=lambda x: x["enrichment"], reverse=True)
+    return by_pair
+
+def signal_details(df, drug, reaction, drug_col, react_col, case_col, serious_col, week_col, sample_n):
+    mask = df[drug_col].str.upper().fillna("") == str(drug).upper()
+    mask &= df[react_col].str.upper().fillna("") == str(reaction).upper()
+    sub = df[mask].copy()
+
+    # serious pct
+    if serious_col and serious_col in sub.columns:
+        serious_pct = (sub[serious_col].fillna("").str.upper().isin(SERIOUS_VALUES).sum() / max(1, len(sub)))
+    else:
+        serious_pct = None
+
+    # sample case ids
+    case_ids = []
+    if case_col and case_col in sub.columns:
+        case_ids = sub[case_col].dropna().unique().tolist()[:sample_n]
+
+    # weekly trend (simple counts per week if week_col exists)
+    trend = None
+    if week_col and week_col in sub.columns:
+        trend = sub.groupby(week_col).size().reset_index(name="count").sort_values(week_col).to_dict(orient="records")
+
+    return serious_pct, case_ids, trend
+
+def _rounded(rows):
+    # compare details the way they are written out (serious_pct is rounded to 2 decimals)
+    return [(round(float(p) * 100, 2) if p is not None else None, ids, trend) for p, ids, trend in rows]
+
+def enrich(signals_csv, clustered_csv, out_json, sample_n=5, clusters_json=None, workers=1, verify=False):
+    import pandas as pd
+    import parallel
     df = pd.read_csv(clustered_csv, dtype=str)
     signals = load_signals(signals_csv)
+    cluster_pairs = load_cluster_pairs(clusters_json) if clusters_json else None
 
     # tolerant column names
     drug_col = next((c for c in df.columns if c.lower() in ("drugname","drug_name","drug")), None)
@@ -16,46 +67,63 @@ def enrich(signals_csv, clustered_csv, out_json, sample_n=5):
     serious_col = next((c for c in df.columns if c.lower() in ("serious","seriousness","seriousnessdeath")), None)
     week_col = next((c for c in df.columns if c.lower() in ("week","event_week","event_dt_week")), None)
 
+    stats = None
+    if workers != 1 and len(signals):
+        # aggregate every signal in one partition-parallel pass instead of masking the data per signal
+        keys = sorted({(str(d).upper(), str(r).upper()) for d, r in zip(signals.iloc[:, 0], signals.iloc[:, 1])})
+        stats, timing = parallel.enrich_stats(df, keys, drug_col, react_col, case_col, serious_col, week_col,
+                                              SERIOUS_VALUES, workers or parallel.default_workers(), sample_n)
+        key_pos = {k: i for i, k in enumerate(keys)}
+
+    def details(drug, reaction):
+        if stats is None:
+            return signal_details(df, drug, reaction, drug_col, react_col, case_col, serious_col, week_col, sample_n)
+        i = key_pos[(str(drug).upper(), str(reaction).upper())]
+        serious_pct = stats["serious"][i] / max(1, stats["total"][i]) if serious_col else None
+        case_ids = stats["samples"][i] if case_col else []
+        trend = stats["trends"][i] if week_col else None
+        return serious_pct, case_ids, trend
+
+    if stats is not None and verify:
+        t0 = time.perf_counter()
+        serial = [signal_details(df, row.iloc[0], row.iloc[1], drug_col, react_col, case_col, serious_col,
+                                 week_col, sample_n) for _, row in signals.iterrows()]
+        timing["serial"] = time.perf_counter() - t0
+        # the serial path masks the data once per signal; scale against the same aggregation on one worker
+        _, single = parallel.enrich_stats(df, keys, drug_col, react_col, case_col, serious_col, week_col,
+                                          SERIOUS_VALUES, 1, sample_n)
+        timing["single"] = single["wall"]
+        parallel_rows = [details(row.iloc[0], row.iloc[1]) for _, row in signals.iterrows()]
+        if _rounded(serial) != _rounded(parallel_rows):
+            raise AssertionError("Parallel enrichment differs from the serial path")
+        print("Verified: parallel enrichment identical to serial path")
+
     out = {"total_signals": len(signals), "signals": []}
     for _, row in signals.iterrows():
         drug = row.iloc[0]
         reaction = row.iloc[1]
         count = int(row["count"])
+        serious_pct, case_ids, trend = details(drug, reaction)
 
-        mask = df[drug_col].str.upper().fillna("") == str(drug).upper()
-        mask &= df[react_col].str.upper().fillna("") == str(reaction).upper()
-        sub = df[mask].copy()
-
-        # serious pct
-        if serious_col and serious_col in sub.columns:
-            serious_pct = (sub[serious_col].fillna("").str.upper().isin(["Y","YES","1","SERIOUS","S"]).sum() / max(1, len(sub)))
-        else:
-            serious_pct = None
-
-        # sample case ids
-        case_ids = []
-        if case_col and case_col in sub.columns:
-            case_ids = sub[case_col].dropna().unique().tolist()[:sample_n]
-
-        # weekly trend (simple counts per week if week_col exists)
-        trend = None
-        if week_col and week_col in sub.columns:
-            trend = sub.groupby(week_col).size().reset_index(name="count").sort_values(week_col).to_dict(orient="records")
-
-        out["signals"].append({
+        item = {
             "drug": drug,
             "reaction": reaction,
             "count": count,
             "serious_pct": (round(float(serious_pct)*100,2) if serious_pct is not None else None),
             "sample_case_ids": case_ids,
             "weekly_trend": trend
-        })
+        }
+        if cluster_pairs is not None:
+            item["clusters"] = cluster_pairs.get((str(drug).upper(), str(reaction).upper()), [])
+        out["signals"].append(item)
 
     if out_json and os.path.dirname(out_json):
         os.makedirs(os.path.dirname(out_json), exist_ok=True)
     with open(out_json, "w", encoding="utf-8") as f:
         json.dump(out, f, indent=2)
     print("Saved enrichment to", out_json)
+    if stats is not None:
+        parallel.report(timing, "Parallel enrichment")
 
 if __name__ == "__main__":
     p = argparse.ArgumentParser()
@@ -63,6 +131,9 @@ if __name__ == "__main__":
     p.add_argument("--clustered", required=True)
     p.add_argument("--out", required=True)
     p.add_argument("--sample_n", type=int, default=5)
+    p.add_argument("--clusters", help="cluster_summaries.json from signal_detection")
+    p.add_argument("--workers", type=int, default=1, help="Worker processes for partition-parallel enrichment (0 = all cores)")
+    p.add_argument("--verify", action="store_true", help="With --workers, also run the serial path, check results match and report speedup and scaling efficiency")
     args = p.parse_args()
-    enrich(args.signals, args.clustered, args.out, args.sample_n)
+    enrich(args.signals, args.clustered, args.out, args.sample_n, args.clusters, args.workers, args.verify)
 
@@ -0,0 +1,390 @@
+# src/vector_index.py
+"""
+Nearest-neighbour search over report embeddings (the .npy from embeddings.py).
+
+Two index kinds, same on-disk layout:
+  exact  brute-force cosine top-k, scanned in chunks (fine up to ~50k reports)
+  ivf    spherical k-means coarse quantizer; vectors are stored grouped by
+         list so each probed list is one contiguous slice of the file
+
+Vectors are L2-normalized and stored as float32, or as int8 with a per-row
+scale (--quantize int8, 4x smaller). New quarters are appended with `add`:
+new vectors are assigned to the existing centroids, no retraining. Re-adding
+report ids already in the index replaces their vectors, so re-running an
+import is safe. An exact index that grows past EXACT_MAX is rebuilt as ivf.
+`add` is incremental in compute only: it reads the whole vectors file into
+memory and save() rewrites it, so each add costs O(n) memory and I/O.
+
+Index directory:
+  meta.json          kind, dim, quantization
+  vectors.npy        (n, dim) float32 or int8, grouped by list for ivf
+  scales.npy         (n,) float32, int8 only
+  ids.npy            (n,) int64 report ids (primaryid, or row number)
+  centroids.npy      (n_lists, dim) float32, ivf only
+  list_offsets.npy   (n_lists + 1,) int64, ivf only
+Arrays are opened with mmap_mode="r", so loading is near-instant.
+
+Usage:
+  python src/vector_index.py build --emb data/embeddings.npy --input data/faers_clustered.csv --out outputs/vector_index
+  python src/vector_index.py add --index outputs/vector_index --emb data/embeddings_q3.npy --input data/faers_q3.csv
+  python src/vector_index.py query --index outputs/vector_index --case 1078729226 --k 10
+  python src/vector_index.py query --index outputs/vector_index --cluster 3 --input data/faers_clustered.csv
+"""
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+EXACT_MAX = 50_000
+CHUNK = 65_536
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return x / norms
+
+
+def _quantize(x):
+    scales = np.abs(x).max(axis=1) / 127
+    scales[scales == 0] = 1
+    q = np.rint(x / scales[:, None]).astype(np.int8)
+    return q, scales.astype(np.float32)
+
+
+def _topk(scores, k):
+    """Row-wise top-k (indices, values) of a 2D score matrix, best first."""
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    vals = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-vals, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+
+def _assign(x, centroids):
+    out = np.empty(len(x), dtype=np.int64)
+    for s in range(0, len(x), CHUNK):
+        out[s:s + CHUNK] = np.argmax(x[s:s + CHUNK] @ centroids.T, axis=1)
+    return out
+
+
+def _kmeans(x, n_lists, iters=10, seed=0):
+    rng = np.random.default_rng(seed)
+    sample = x[np.sort(rng.choice(len(x), min(len(x), n_lists * 64), replace=False))]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iters):
+        assign = _assign(sample, centroids)
+        order = np.argsort(assign, kind="stable")
+        present, starts = np.unique(assign[order], return_index=True)
+        # empty lists keep their previous centroid
+        centroids[present] = _normalize(np.add.reduceat(sample[order], starts, axis=0))
+    return centroids
+
+
+class VectorIndex:
+    def __init__(self, vectors, ids, scales=None, centroids=None, list_offsets=None):
+        self.vectors = vectors
+        self.ids = ids
+        self.scales = scales
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+
+    @property
+    def kind(self):
+        return "exact" if self.centroids is None else "ivf"
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, emb, ids=None, kind="auto", quantize=None, n_lists=None):
+        x = _normalize(emb)
+        ids = np.arange(len(x), dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        if kind == "auto":
+            kind = "exact" if len(x) <= EXACT_MAX else "ivf"
+
+        centroids = list_offsets = None
+        if kind == "ivf":
+            n_lists = n_lists or max(1, int(4 * np.sqrt(len(x))))
+            centroids = _kmeans(x, min(n_lists, len(x)))
+            assign = _assign(x, centroids)
+            order = np.argsort(assign, kind="stable")
+            x, ids = x[order], ids[order]
+            list_offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1)).astype(np.int64)
+
+        scales = None
+        if quantize == "int8":
+            x, scales = _quantize(x)
+        return cls(x, ids, scales, centroids, list_offsets)
+
+    def add(self, emb, ids):
+        """
+        Append new vectors (e.g. a new quarter) without retraining centroids.
+        Ids already in the index (or repeated in `ids`) keep only their newest vector.
+        """
+        x = _normalize(emb)
+        ids = np.asarray(ids, dtype=np.int64)
+        # last occurrence wins within the new batch
+        _, last = np.unique(ids[::-1], return_index=True)
+        keep_new = np.sort(len(ids) - 1 - last)
+        x, ids = x[keep_new], ids[keep_new]
+
+        keep_old = ~np.isin(self.ids, ids)
+        old = np.asarray(self.vectors)[keep_old]
+        old_ids = np.asarray(self.ids)[keep_old]
+        old_scales = np.asarray(self.scales)[keep_old] if self.scales is not None else None
+        new = x
+        new_scales = None
+        if self.scales is not None:
+            new, new_scales = _quantize(x)
+
+        if self.centroids is None:
+            self.vectors = np.concatenate([old, new])
+            self.ids = np.concatenate([old_ids, ids])
+            if new_scales is not None:
+                self.scales = np.concatenate([old_scales, new_scales])
+            if len(self.ids) > EXACT_MAX:
+                # past the exact scan's comfortable size: retrain as ivf
+                full = self.vectors.astype(np.float32)
+                if self.scales is not None:
+                    full *= self.scales[:, None]
+                grown = VectorIndex.build(full, self.ids, kind="ivf",
+                                          quantize="int8" if self.scales is not None else None)
+                self.__dict__.update(grown.__dict__)
+            return self
+
+        # merge by list: old rows already grouped, new rows slot in after each list's old members
+        old_lists = np.repeat(np.arange(len(self.centroids)), np.diff(self.list_offsets))[keep_old]
+        lists = np.concatenate([old_lists, _assign(x, self.centroids)])
+        order = np.argsort(lists, kind="stable")
+        self.vectors = np.concatenate([old, new])[order]
+        self.ids = np.concatenate([old_ids, ids])[order]
+        if new_scales is not None:
+            self.scales = np.concatenate([old_scales, new_scales])[order]
+        self.list_offsets = np.searchsorted(lists[order], np.arange(len(self.centroids) + 1)).astype(np.int64)
+        return self
+
+    def _scores(self, start, stop, q):
+        block = self.vectors[start:stop]
+        if self.scales is not None:
+            return (block.astype(np.float32) @ q.T) * self.scales[start:stop, None]
+        return block @ q.T
+
+    def _search_exact(self, q, k):
+        best_idx = np.empty((len(q), 0), dtype=np.int64)
+        best_val = np.empty((len(q), 0), dtype=np.float32)
+        for s in range(0, len(self), CHUNK):
+            scores = self._scores(s, s + CHUNK, q).T
+            idx, val = _topk(scores, k)
+            cand_idx = np.concatenate([best_idx, idx + s], axis=1)
+            cand_val = np.concatenate([best_val, val], axis=1)
+            sel, best_val = _topk(cand_val, k)
+            best_idx = np.take_along_axis(cand_idx, sel, axis=1)
+        return best_idx, best_val
+
+    def _search_ivf(self, q, k, n_probe):
+        probe, _ = _topk(q @ self.centroids.T, n_probe)
+        out_idx = np.full((len(q), k), -1, dtype=np.int64)
+        out_val = np.full((len(q), k), -np.inf, dtype=np.float32)
+        for i in range(len(q)):
+            rows, vals = [], []
+            for l in probe[i]:
+                s, e = self.list_offsets[l], self.list_offsets[l + 1]
+                if e > s:
+                    rows.append(np.arange(s, e))
+                    vals.append(self._scores(s, e, q[i:i + 1])[:, 0])
+            if not rows:
+                continue
+            rows, vals = np.concatenate(rows), np.concatenate(vals)
+            sel, top = _topk(vals[None, :], k)
+            out_idx[i, :sel.shape[1]] = rows[sel[0]]
+            out_val[i, :sel.shape[1]] = top[0]
+        return out_idx, out_val
+
+    def search(self, queries, k=10, n_probe=8, exclude=None):
+        """
+        Batch top-k by cosine similarity. Returns (ids, scores), each (n_queries, k); missing slots are -1 / -inf.
+        Report ids in `exclude` (e.g. the query case itself) are left out of the results.
+        """
+        q = _normalize(np.atleast_2d(queries))
+        if len(self) == 0:
+            return np.full((len(q), k), -1, dtype=np.int64), np.full((len(q), k), -np.inf, dtype=np.float32)
+
+        exclude = np.asarray([] if exclude is None else exclude, dtype=np.int64)
+        # fetch enough extra hits to still have k after dropping every excluded vector
+        k_fetch = k + (int(np.isin(self.ids, exclude).sum()) if len(exclude) else 0)
+        if self.centroids is None:
+            idx, val = self._search_exact(q, k_fetch)
+        else:
+            idx, val = self._search_ivf(q, k_fetch, n_probe)
+        ids = np.where(idx >= 0, self.ids[np.maximum(idx, 0)], -1)
+
+        if len(exclude):
+            drop = np.isin(ids, exclude)
+            ids = np.where(drop, -1, ids)
+            val = np.where(drop, -np.inf, val)
+            # move kept hits to the front, preserving their order
+            order = np.argsort(drop, axis=1, kind="stable")[:, :k]
+            ids = np.take_along_axis(ids, order, axis=1)
+            val = np.take_along_axis(val, order, axis=1)
+        if ids.shape[1] < k:
+            pad = k - ids.shape[1]
+            ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+            val = np.pad(val, ((0, 0), (0, pad)), constant_values=-np.inf)
+        return ids, val
+
+    def vectors_for(self, ids):
+        """Float32 vectors of the given report ids (first match per id)."""
+        if len(self.ids) == 0:
+            return np.empty((0, self.vectors.shape[1]), dtype=np.float32)
+        order = np.argsort(self.ids, kind="stable")
+        sorted_ids = self.ids[order]
+        wanted = np.asarray(ids, dtype=np.int64)
+        pos = np.searchsorted(sorted_ids, wanted)
+        pos = np.minimum(pos, len(sorted_ids) - 1)
+        found = sorted_ids[pos] == wanted
+        rows = np.sort(order[pos[found]])
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            block = block * self.scales[rows, None]
+        return block
+
+    def save(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        arrays = {"vectors": self.vectors, "ids": self.ids}
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        if self.centroids is not None:
+            arrays["centroids"] = self.centroids
+            arrays["list_offsets"] = self.list_offsets
+        for name, arr in arrays.items():
+            # write then rename, so an index that is currently mmapped is never truncated underneath
+            tmp = os.path.join(out_dir, name + ".tmp.npy")
+            np.save(tmp, np.asarray(arr))
+            os.replace(tmp, os.path.join(out_dir, name + ".npy"))
+        meta = {
+            "kind": self.kind,
+            "dim": int(self.vectors.shape[1]),
+            "count": len(self),
+            "quantize": "int8" if self.scales is not None else None,
+        }
+        with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, index_dir, mmap=True):
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+
+        def arr(name):
+            return np.load(os.path.join(index_dir, name + ".npy"), mmap_mode=mode)
+
+        scales = arr("scales") if meta["quantize"] == "int8" else None
+        if meta["kind"] == "ivf":
+            # centroids and offsets are small and hit on every query; keep them in memory
+            return cls(arr("vectors"), np.asarray(arr("ids")), scales,
+                       np.asarray(arr("centroids")), np.asarray(arr("list_offsets")))
+        return cls(arr("vectors"), np.asarray(arr("ids")), scales)
+
+
+def _report_ids(input_csv, n):
+    if not input_csv:
+        return None
+    # pandas only when reading a CSV; search itself is numpy alone
+    import pandas as pd
+    df = pd.read_csv(input_csv, usecols=lambda c: c.lower() == "primaryid")
+    if len(df) != n:
+        raise ValueError(f"Row mismatch: csv has {len(df)}, embeddings have {n}")
+    return df.iloc[:, 0].to_numpy(dtype=np.int64)
+
+
+def main_build(emb_path, input_csv, out_dir, kind, quantize, n_lists):
+    emb = np.load(emb_path)
+    ids = _report_ids(input_csv, len(emb))
+    t0 = time.perf_counter()
+    index = VectorIndex.build(emb, ids, kind=kind, quantize=quantize, n_lists=n_lists)
+    index.save(out_dir)
+    print(f"Built {index.kind} index over {len(index)} vectors in {time.perf_counter() - t0:.2f}s -> {out_dir}")
+
+
+def main_add(index_dir, emb_path, input_csv):
+    index = VectorIndex.load(index_dir)
+    emb = np.load(emb_path)
+    ids = _report_ids(input_csv, len(emb))
+    if ids is None:
+        # row-number ids can only be extended when the index itself is keyed by row number
+        if not np.array_equal(np.sort(index.ids), np.arange(len(index))):
+            raise SystemExit("This index is keyed by primaryid; pass --input with the new reports' CSV")
+        ids = np.arange(len(index), len(index) + len(emb), dtype=np.int64)
+    replaced = int(np.isin(np.unique(ids), index.ids).sum())
+    kind = index.kind
+    index.add(emb, ids).save(index_dir)
+    print(f"Added {len(emb)} vectors ({replaced} replaced existing ids); index now holds {len(index)}")
+    if index.kind != kind:
+        print(f"Index grew past {EXACT_MAX} vectors; rebuilt as {index.kind}")
+
+
+def main_query(index_dir, case_id, cluster, input_csv, k, n_probe):
+    index = VectorIndex.load(index_dir)
+    exclude = None
+    if case_id is not None:
+        q = index.vectors_for([case_id])
+        label = f"case {case_id}"
+        exclude = [case_id]
+    else:
+        if not input_csv:
+            raise SystemExit("--cluster needs --input (clustered CSV with primaryid and cluster columns)")
+        import pandas as pd
+        df = pd.read_csv(input_csv, usecols=["primaryid", "cluster"])
+        members = df.loc[df["cluster"] == cluster, "primaryid"].to_numpy(dtype=np.int64)
+        q = index.vectors_for(members).mean(axis=0, keepdims=True)
+        label = f"cluster {cluster} ({len(members)} reports)"
+    if len(q) == 0:
+        raise SystemExit(f"No vectors found for {label}")
+
+    t0 = time.perf_counter()
+    ids, scores = index.search(q, k=k, n_probe=n_probe, exclude=exclude)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    print(f"Top {k} reports similar to {label} ({index.kind}, {elapsed_ms:.2f} ms):")
+    for pid, score in zip(ids[0], scores[0]):
+        if pid >= 0:
+            print(f"  {pid}\t{score:.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    b = sub.add_parser("build", help="Build an index from an embeddings .npy")
+    b.add_argument("--emb", required=True)
+    b.add_argument("--input", help="CSV aligned with the embeddings; its primaryid column becomes the report id")
+    b.add_argument("--out", default="outputs/vector_index")
+    b.add_argument("--kind", choices=["auto", "exact", "ivf"], default="auto")
+    b.add_argument("--quantize", choices=["int8"], default=None)
+    b.add_argument("--n_lists", type=int, default=None, help="IVF lists (default 4*sqrt(n))")
+
+    a = sub.add_parser("add", help="Append new embeddings to an existing index")
+    a.add_argument("--index", required=True)
+    a.add_argument("--emb", required=True)
+    a.add_argument("--input")
+
+    q = sub.add_parser("query", help="Find reports similar to a case or a cluster")
+    q.add_argument("--index", default="outputs/vector_index")
+    target = q.add_mutually_exclusive_group(required=True)
+    target.add_argument("--case", type=int, help="primaryid of the query report")
+    target.add_argument("--cluster", type=int, help="cluster label; queries with the cluster's mean vector")
+    q.add_argument("--input", help="Clustered CSV (needed with --cluster)")
+    q.add_argument("--k", type=int, default=10)
+    q.add_argument("--n_probe", type=int, default=8, help="IVF lists scanned per query")
+
+    args = parser.parse_args()
+    if args.cmd == "build":
+        main_build(args.emb, args.input, args.out, args.kind, args.quantize, args.n_lists)
+    elif args.cmd == "add":
+        main_add(args.index, args.emb, args.input)
+    else:
+        main_query(args.index, args.case, args.cluster, args.input, args.k, args.n_probe)
@@ -0,0 +1,196 @@
+# src/worker.py
+"""
+Warm local worker.
+
+A long-lived process on a unix socket that keeps the embedding model, case
+indexes and vector indexes loaded, so small ad-hoc jobs (embed or score a
+handful of new reports, drilldown queries) skip the 5-10 s cold start.
+
+Protocol: one JSON request per line, one JSON response per line.
+  {"op": "ping"}
+  {"op": "embed", "texts": [...]}
+  {"op": "similar", "index": "outputs/vector_index", "texts": [...], "k": 10}
+  {"op": "similar", "index": "outputs/vector_index", "case": 1078729226, "k": 10}
+  {"op": "cases", "index": "outputs/case_index.npz", "drug": "XOLAIR", "pt": "...",
+   "week_from": "2015-01-01", "week_to": "2015-06-30", "serious": true}
+  {"op": "vocab", "index": "outputs/case_index.npz", "field": "drug"}
+  {"op": "shutdown"}
+Indexes are reloaded when their files change on disk (a rebuild or `add`).
+Responses are {"ok": true, ...} or {"ok": false, "error": "..."}.
+
+The client side (call / the "call" command) only imports the standard library,
+so it starts in milliseconds.
+
+Usage:
+  python src/worker.py serve --socket /tmp/pv-worker.sock --preload
+  python src/worker.py call --socket /tmp/pv-worker.sock '{"op": "similar", "index": "outputs/vector_index", "texts": ["ozempic | pancreatitis | HO"]}'
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+DEFAULT_SOCKET = "/tmp/pv-worker.sock"
+
+
+class WarmState:
+    """Everything the worker keeps loaded between requests; each item is loaded on first use."""
+
+    def __init__(self):
+        # path -> (mtime of the file that marks a rebuild, loaded index)
+        self.case_indexes = {}
+        self.vector_indexes = {}
+
+    def case_index(self, path):
+        mtime = os.path.getmtime(path)
+        cached = self.case_indexes.get(path)
+        if cached is None or cached[0] != mtime:
+            from case_index import CaseIndex
+            self.case_indexes[path] = (mtime, CaseIndex.load(path))
+        return self.case_indexes[path][1]
+
+    def vector_index(self, path):
+        # save() rewrites meta.json last, so its mtime changes after every build/add
+        mtime = os.path.getmtime(os.path.join(path, "meta.json"))
+        cached = self.vector_indexes.get(path)
+        if cached is None or cached[0] != mtime:
+            from vector_index import VectorIndex
+            self.vector_indexes[path] = (mtime, VectorIndex.load(path))
+        return self.vector_indexes[path][1]
+
+    def embed(self, texts):
+        import embeddings
+        return embeddings.encode([str(t) for t in texts])
+
+    # ------------------------------------------------------------ ops
+
+    def op_ping(self, req):
+        return {"case_indexes": list(self.case_indexes), "vector_indexes": list(self.vector_indexes)}
+
+    def op_embed(self, req):
+        return {"vectors": self.embed(req["texts"]).tolist()}
+
+    def op_similar(self, req):
+        index = self.vector_index(req["index"])
+        exclude = None
+        if "case" in req:
+            q = index.vectors_for([req["case"]])
+            if len(q) == 0:
+                raise KeyError(f"case {req['case']} not in index")
+            exclude = [req["case"]]
+        else:
+            q = self.embed(req["texts"])
+        ids, scores = index.search(q, k=int(req.get("k", 10)), n_probe=int(req.get("n_probe", 8)), exclude=exclude)
+        return {"ids": ids.tolist(), "scores": [[round(float(s), 6) for s in row] for row in scores]}
+
+    def op_cases(self, req):
+        index = self.case_index(req["index"])
+        ids = index.query(drug=req.get("drug"), pt=req.get("pt"), week_from=req.get("week_from"),
+                          week_to=req.get("week_to"), serious=req.get("serious"))
+        limit = req.get("limit")
+        return {"count": int(len(ids)), "ids": ids[:limit].tolist() if limit else ids.tolist()}
+
+    def op_vocab(self, req):
+        index = self.case_index(req["index"])
+        vocab = {"drug": index.drug_vocab, "pt": index.pt_vocab, "week": index.week_vocab}[req.get("field", "drug")]
+        return {"values": vocab.tolist()}
+
+    def handle(self, req):
+        fn = getattr(self, "op_" + str(req.get("op")), None)
+        if fn is None:
+            raise ValueError(f"unknown op: {req.get('op')}")
+        return fn(req)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            t0 = time.perf_counter()
+            try:
+                req = json.loads(line)
+                if req.get("op") == "shutdown":
+                    self._reply({"ok": True})
+                    # shutdown() blocks until serve_forever returns, so hand it to another thread
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                    return
+                resp = {"ok": True, **self.server.state.handle(req)}
+            except Exception as e:
+                resp = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            resp["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+            self._reply(resp)
+
+    def _reply(self, resp):
+        self.wfile.write((json.dumps(resp) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+
+class WorkerServer(socketserver.UnixStreamServer):
+    # one request at a time: the model and indexes are not shared across threads
+    def __init__(self, path, state):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o600)
+        self.state = state
+
+
+def serve(socket_path, preload=False, case_index=None, vector_index=None):
+    state = WarmState()
+    if preload:
+        print("Loading embedding model...")
+        state.embed(["warmup"])
+    if case_index:
+        state.case_index(case_index)
+    if vector_index:
+        state.vector_index(vector_index)
+
+    with WorkerServer(socket_path, state) as server:
+        print("Worker listening on", socket_path)
+        try:
+            server.serve_forever()
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+    print("Worker stopped.")
+
+
+def call(request, socket_path=DEFAULT_SOCKET, timeout=60):
+    """Send one request to a running worker and return the decoded response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        buf = b""
+        while not buf.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            buf += chunk
+    return json.loads(buf)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("serve", help="Run the warm worker")
+    s.add_argument("--socket", default=DEFAULT_SOCKET)
+    s.add_argument("--preload", action="store_true", help="Load the embedding model at startup")
+    s.add_argument("--case_index", help="Case index (.npz) to load at startup")
+    s.add_argument("--vector_index", help="Vector index directory to load at startup")
+
+    c = sub.add_parser("call", help="Send one JSON request to a running worker")
+    c.add_argument("request", help='JSON request, e.g. \'{"op": "ping"}\'')
+    c.add_argument("--socket", default=DEFAULT_SOCKET)
+
+    args = parser.parse_args()
+    if args.cmd == "serve":
+        serve(args.socket, args.preload, args.case_index, args.vector_index)
+    else:
+        print(json.dumps(call(json.loads(args.request), args.socket), indent=2))
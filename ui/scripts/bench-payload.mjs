@@ -0,0 +1,42 @@
+// Decode and windowing cost of a compact payload, without a browser.
+// Generate a payload first:
+//   python src/payload.py --synthetic 100000 --out_dir /tmp/pv-bench
+//   node ui/scripts/bench-payload.mjs /tmp/pv-bench/signals_compact.json
+import { readFileSync, statSync } from "node:fs";
+import { performance } from "node:perf_hooks";
+import { decodeCompact } from "../src/compactPayload.js";
+import { visibleRange } from "../src/listWindow.js";
+
+const ROW_HEIGHT = 28;
+const HEIGHT = ROW_HEIGHT * 20;
+const path = process.argv[2] || "public/signals_compact.json";
+
+const text = readFileSync(path, "utf-8");
+let t0 = performance.now();
+const data = JSON.parse(text);
+const parseMs = performance.now() - t0;
+
+t0 = performance.now();
+const rows = decodeCompact(data);
+const decodeMs = performance.now() - t0;
+
+// one window per scroll step across the whole list, as a full scroll-through would render
+t0 = performance.now();
+let rendered = 0;
+let windows = 0;
+for (let top = 0; top < rows.length * ROW_HEIGHT; top += HEIGHT) {
+  const [start, end] = visibleRange(rows.length, ROW_HEIGHT, HEIGHT, top);
+  const labels = [];
+  for (let i = start; i < end; i++) {
+    const s = rows[i];
+    labels.push(`${s.drug} – ${s.reaction} (${s.count})`);
+  }
+  rendered += labels.length;
+  windows++;
+}
+const windowMs = (performance.now() - t0) / windows;
+
+const [start, end] = visibleRange(rows.length, ROW_HEIGHT, HEIGHT, 0);
+console.log(`${path}: ${rows.length} rows, ${(statSync(path).size / 1e6).toFixed(2)} MB`);
+console.log(`JSON.parse ${parseMs.toFixed(1)} ms, decode ${decodeMs.toFixed(1)} ms`);
+console.log(`window: ${end - start} rows per render, ${(windowMs * 1000).toFixed(1)} us to build (${windows} windows, ${rendered} rows)`);
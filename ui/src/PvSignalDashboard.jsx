@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import {
   ResponsiveContainer,
   BarChart,
@@ -8,19 +8,42 @@ import {
   Tooltip,
   CartesianGrid
 } from "recharts";
+import VirtualList from "./VirtualList";
+import { decodeCompact } from "./compactPayload";
+
+const ROW_HEIGHT = 28;
+// shown in the list row / heading; any other scalar field goes in the detail table
+const BASE_FIELDS = ["drug", "reaction", "count", "summary"];
+
+async function loadSignals() {
+  const res = await fetch("/signals_compact.json");
+  // the dev server answers missing files with index.html, so check the type too
+  if (res.ok && (res.headers.get("content-type") || "").includes("json")) {
+    const data = await res.json();
+    return { signals: decodeCompact(data), summariesUrl: data.summaries ? `/${data.summaries}` : null };
+  }
+  // older exports: one pretty-printed file with summaries inline
+  const legacy = await fetch("/signals_with_summaries.json");
+  if (!legacy.ok) throw new Error("Failed to load JSON");
+  const data = await legacy.json();
+  return { signals: data.signals || [], summariesUrl: null };
+}
 
 export default function PvSignalDashboard() {
   const [signals, setSignals] = useState([]);
+  const [summariesUrl, setSummariesUrl] = useState(null);
+  const [summaries, setSummaries] = useState(null);
+  const [selected, setSelected] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const summariesRequest = useRef(null);
 
   useEffect(() => {
     async function load() {
       try {
-        const res = await fetch("/signals_with_summaries.json");
-        if (!res.ok) throw new Error("Failed to load JSON");
-        const data = await res.json();
-        setSignals(data.signals || []);
+        const { signals, summariesUrl } = await loadSignals();
+        setSignals(signals);
+        setSummariesUrl(summariesUrl);
       } catch (err) {
         setError(err.message);
       } finally {
@@ -30,9 +53,29 @@ export default function PvSignalDashboard() {
     load();
   }, []);
 
+  // summaries are only fetched the first time a signal is opened
+  function select(i) {
+    setSelected(i);
+    if (summariesUrl && !summariesRequest.current) {
+      summariesRequest.current = fetch(summariesUrl)
+        .then((res) => (res.ok ? res.json() : []))
+        .then(setSummaries)
+        .catch(() => setSummaries([]));
+    }
+  }
+
   if (loading) return <div>Loading dashboard...</div>;
   if (error) return <div>Error loading dashboard: {error}</div>;
 
+  const current = selected !== null ? signals[selected] : null;
+  let summary = null;
+  if (current) {
+    if (current.summary != null) summary = current.summary;
+    else if (!summariesUrl) summary = "No summary available";
+    else if (!summaries) summary = "Loading summary...";
+    else summary = summaries[selected] || "No summary available";
+  }
+
   return (
     <div style={{ padding: 20 }}>
       <h1>PV Safety Signal Dashboard</h1>
@@ -49,13 +92,48 @@ export default function PvSignalDashboard() {
       </ResponsiveContainer>
 
       <h2>Signal List</h2>
-      <ul>
-        {signals.slice(0, 20).map((s, i) => (
-          <li key={i}>
+      <VirtualList
+        items={signals}
+        rowHeight={ROW_HEIGHT}
+        height={ROW_HEIGHT * 20}
+        renderRow={(s, i) => (
+          <div
+            key={i}
+            onClick={() => select(i)}
+            style={{
+              height: ROW_HEIGHT,
+              lineHeight: `${ROW_HEIGHT}px`,
+              padding: "0 8px",
+              cursor: "pointer",
+              whiteSpace: "nowrap",
+              overflow: "hidden",
+              textOverflow: "ellipsis",
+              background: i === selected ? "#eef" : undefined
+            }}
+          >
             <b>{s.drug}</b> – {s.reaction} ({s.count})
-          </li>
-        ))}
-      </ul>
+          </div>
+        )}
+      />
+
+      {current && (
+        <div style={{ marginTop: 16 }}>
+          <h3>{current.drug} – {current.reaction}</h3>
+          <table>
+            <tbody>
+              {Object.entries(current)
+                .filter(([k, v]) => !BASE_FIELDS.includes(k) && (v === null || typeof v !== "object"))
+                .map(([k, v]) => (
+                  <tr key={k}>
+                    <td style={{ paddingRight: 12 }}>{k}</td>
+                    <td>{v ?? "–"}</td>
+                  </tr>
+                ))}
+            </tbody>
+          </table>
+          <p style={{ whiteSpace: "pre-wrap" }}>{summary}</p>
+        </div>
+      )}
     </div>
   );
-}
\ No newline at end of file
+}
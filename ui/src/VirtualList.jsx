@@ -0,0 +1,28 @@
+import React, { useState } from "react";
+import { visibleRange } from "./listWindow";
+
+// Windowed list: only the rows in (and just around) the viewport are rendered,
+// so the DOM stays small no matter how many items there are.
+export default function VirtualList({ items, rowHeight, height, overscan = 10, renderRow }) {
+  const [scrollTop, setScrollTop] = useState(0);
+
+  const [start, end] = visibleRange(items.length, rowHeight, height, scrollTop, overscan);
+
+  const visible = [];
+  for (let i = start; i < end; i++) {
+    visible.push(renderRow(items[i], i));
+  }
+
+  return (
+    <div
+      style={{ height, overflowY: "auto", border: "1px solid #ddd" }}
+      onScroll={(e) => setScrollTop(e.currentTarget.scrollTop)}
+    >
+      <div style={{ height: items.length * rowHeight, position: "relative" }}>
+        <div style={{ position: "absolute", top: start * rowHeight, left: 0, right: 0 }}>
+          {visible}
+        </div>
+      </div>
+    </div>
+  );
+}
@@ -0,0 +1,22 @@
+// signals_compact.json (see src/payload.py): string tables + column arrays.
+// Every column is decoded; columns with a string table hold indices into it.
+export function decodeCompact(data) {
+  const { strings, columns } = data;
+  // drug / reaction / count are always present: build them as a literal so rows share one shape
+  const extra = Object.keys(columns)
+    .filter((k) => k !== "drug" && k !== "reaction" && k !== "count")
+    .map((k) => [k, columns[k], strings[k]]);
+  const rows = new Array(data.total_signals);
+  for (let i = 0; i < rows.length; i++) {
+    const row = {
+      drug: strings.drug[columns.drug[i]],
+      reaction: strings.reaction[columns.reaction[i]],
+      count: columns.count[i]
+    };
+    for (const [k, values, table] of extra) {
+      row[k] = table ? table[values[i]] : values[i];
+    }
+    rows[i] = row;
+  }
+  return rows;
+}
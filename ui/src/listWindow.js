@@ -0,0 +1,6 @@
+// [start, end) of the rows VirtualList renders for a given scroll position
+export function visibleRange(count, rowHeight, height, scrollTop, overscan = 10) {
+  const start = Math.max(0, Math.floor(scrollTop / rowHeight) - overscan);
+  const end = Math.min(count, Math.ceil((scrollTop + height) / rowHeight) + overscan);
+  return [start, end];
+}